@@ -4,16 +4,17 @@ import sys
 
 import numpy as np
 import torch as th
-import torch.nn as nn
 import torch.nn.functional as F
 
 from models.priors import ReverseLayerF
-from .utils import correlationMatrix
+from .utils import balancedSampling, squaredErrorSum, compileLoss
 
 try:
-    from functools import reduce
+    from numba import njit, prange
+
+    NUMBA_AVAILABLE = True
 except ImportError:
-    pass
+    NUMBA_AVAILABLE = False
 
 
 class LossManager:
@@ -43,22 +44,78 @@ class LossManager:
         self.weights.append(weight)
         self.losses.append(loss_value)
 
+    @staticmethod
+    def pairsToDevice(pairs, device):
+        """
+        Move the pairs of indices (or any other index array) of every minibatch to the device once,
+        so they are not uploaded again at each training step
+        :param pairs: ([np.ndarray])
+        :param device: (th.device)
+        :return: ([th.Tensor])
+        """
+        use_pinned_memory = th.device(device).type == 'cuda'
+        tensors = []
+        for pair in pairs:
+            tensor = th.from_numpy(pair)
+            if use_pinned_memory:
+                tensor = tensor.pin_memory()
+            tensors.append(tensor.to(device, non_blocking=True))
+        return tensors
+
     def updateLossHistory(self):
         if self.loss_history is not None:
-            for name, w, loss in zip(self.names, self.weights, self.losses):
-                if w > 0:
-                    if len(self.loss_history[name]) > 0:
-                        self.loss_history[name][-1] += w * loss.item()
-                    else:
-                        self.loss_history[name].append(w * loss.item())
+            active = [(name, w, loss) for name, w, loss in zip(self.names, self.weights, self.losses) if w > 0]
+            if len(active) == 0:
+                return
+            # Retrieve all the values with a single device to host copy
+            values = th.stack([w * loss.detach() for _, w, loss in active]).tolist()
+            for (name, _, _), value in zip(active, values):
+                if len(self.loss_history[name]) > 0:
+                    self.loss_history[name][-1] += value
+                else:
+                    self.loss_history[name].append(value)
 
     def computeTotalLoss(self):
-        return sum([self.weights[i] * self.losses[i] for i in range(len(self.losses))])
+        # Single reduction node instead of a chain of additions
+        return th.stack([weight * loss for weight, loss in zip(self.weights, self.losses)]).sum()
 
     def resetLosses(self):
         self.names, self.weights, self.losses = [], [], []
 
 
+@compileLoss
+def _roboticPriors(states, next_states, dissimilar_pairs, same_actions_pairs):
+    # type: (Tensor, Tensor, Tensor, Tensor) -> Tuple[Tensor, Tensor, Tensor, Tensor]
+    """
+    Fused computation of the 4 Robotic priors (see roboticPriorsLoss)
+    :param states: (th.Tensor)
+    :param next_states: (th.Tensor)
+    :param dissimilar_pairs: (th.Tensor) pairs of indices for the current minibatch
+    :param same_actions_pairs: (th.Tensor) pairs of indices for the current minibatch
+    :return: (th.Tensor, th.Tensor, th.Tensor, th.Tensor)
+    """
+    state_diff = next_states - states
+    state_diff_sq = (state_diff * state_diff).sum(1)
+    # norm (not sqrt of state_diff_sq) has a finite gradient when a state equals the next state
+    state_diff_norm = state_diff.norm(2, dim=1)
+    temp_coherence_loss = state_diff_sq.mean()
+
+    dissimilar_diff = th.index_select(states, 0, dissimilar_pairs[:, 0]) - \
+                      th.index_select(states, 0, dissimilar_pairs[:, 1])
+    causality_loss = th.exp(-(dissimilar_diff * dissimilar_diff).sum(1)).mean()
+
+    # Gather each array only once for the same actions pairs, shared by proportionality and repeatability
+    first, second = same_actions_pairs[:, 0], same_actions_pairs[:, 1]
+    same_actions_diff = th.index_select(states, 0, first) - th.index_select(states, 0, second)
+    state_diff_diff = th.index_select(state_diff, 0, first) - th.index_select(state_diff, 0, second)
+    proportionality_diff = th.index_select(state_diff_norm, 0, first) - th.index_select(state_diff_norm, 0, second)
+
+    proportionality_loss = (proportionality_diff * proportionality_diff).mean()
+    repeatability_loss = (th.exp(-(same_actions_diff * same_actions_diff).sum(1)) *
+                          (state_diff_diff * state_diff_diff).sum(1)).mean()
+    return temp_coherence_loss, causality_loss, proportionality_loss, repeatability_loss
+
+
 def roboticPriorsLoss(states, next_states, minibatch_idx,
             dissimilar_pairs, same_actions_pairs, weight, loss_manager):
     """
@@ -66,31 +123,18 @@ def roboticPriorsLoss(states, next_states, minibatch_idx,
     :param states: (th.Tensor)
     :param next_states: (th.Tensor)
     :param minibatch_idx: (int)
-    :param dissimilar_pairs: ([np.ndarray])
-    :param same_actions_pairs: ([np.ndarray])
+    :param dissimilar_pairs: ([th.Tensor]) pairs already on the device (see LossManager.pairsToDevice)
+    :param same_actions_pairs: ([th.Tensor]) pairs already on the device (see LossManager.pairsToDevice)
     :param weight: coefficient to weight the loss
     :param loss_manager: loss criterion needed to log the loss value (LossManager)
     :return: (th.Tensor)
     """
-    dissimilar_pairs = th.from_numpy(dissimilar_pairs[minibatch_idx]).to(states.device)
-    same_actions_pairs = th.from_numpy(same_actions_pairs[minibatch_idx]).to(states.device)
+    dissimilar_pairs = dissimilar_pairs[minibatch_idx]
+    same_actions_pairs = same_actions_pairs[minibatch_idx]
 
-    state_diff = next_states - states
-    state_diff_norm = state_diff.norm(2, dim=1)
-    similarity = lambda x, y: th.exp(-(x - y).norm(2, dim=1) ** 2)
-    temp_coherence_loss = (state_diff_norm ** 2).mean()
-    causality_loss = similarity(states[dissimilar_pairs[:, 0]],
-                                states[dissimilar_pairs[:, 1]]).mean()
-    proportionality_loss = ((state_diff_norm[same_actions_pairs[:, 0]] -
-                             state_diff_norm[same_actions_pairs[:, 1]]) ** 2).mean()
-
-    repeatability_loss = (
-            similarity(states[same_actions_pairs[:, 0]], states[same_actions_pairs[:, 1]]) *
-            (state_diff[same_actions_pairs[:, 0]] - state_diff[same_actions_pairs[:, 1]]).norm(2,
-                                                                                               dim=1) ** 2).mean()
     weights = [1, 1, 1, 1]
     names = ['temp_coherence_loss', 'causality_loss', 'proportionality_loss', 'repeatability_loss']
-    losses = [temp_coherence_loss, causality_loss, proportionality_loss, repeatability_loss]
+    losses = _roboticPriors(states, next_states, dissimilar_pairs, same_actions_pairs)
 
     total_loss = 0
     for idx in range(len(weights)):
@@ -123,8 +167,7 @@ def inverseModelLoss(actions_pred, actions_st, weight, loss_manager):
     :param loss_manager: loss criterion needed to log the loss value (LossManager)
     :return:
     """
-    loss_fn = nn.CrossEntropyLoss()
-    inverse_loss = loss_fn(actions_pred, actions_st.squeeze(1))
+    inverse_loss = F.cross_entropy(actions_pred, actions_st.squeeze(1))
     loss_manager.addToLosses('inverse_loss', weight, inverse_loss)
     return weight * inverse_loss
 
@@ -137,7 +180,11 @@ def l1Loss(params, weight, loss_manager):
     :param loss_manager: loss criterion needed to log the loss value (LossManager)
     :return:
     """
-    l1_loss = sum([th.sum(th.abs(param)) for param in params])
+    if hasattr(th, '_foreach_norm'):
+        # Multi-tensor kernel: one launch for all the parameters
+        l1_loss = th.stack(th._foreach_norm(list(params), 1)).sum()
+    else:
+        l1_loss = th.stack([param.norm(1) for param in params]).sum()
     loss_manager.addToLosses('l1_loss', weight, l1_loss)
     return weight * l1_loss
 
@@ -164,8 +211,7 @@ def rewardModelLoss(rewards_pred, rewards_st, weight, loss_manager):
     :param loss_manager: loss criterion needed to log the loss value (LossManager)
     :return:
     """
-    loss_fn = nn.CrossEntropyLoss()
-    reward_loss = loss_fn(rewards_pred, target=rewards_st)
+    reward_loss = F.cross_entropy(rewards_pred, rewards_st)
     loss_manager.addToLosses('reward_loss', weight, reward_loss)
     return weight * reward_loss
 
@@ -207,8 +253,7 @@ def generationLoss(decoded, next_decoded, obs, next_obs, weight, loss_manager):
     :param weight: (float)
     :return: (th.Tensor)
     """
-    generation_loss = F.mse_loss(decoded, obs, reduction='sum')
-    generation_loss += F.mse_loss(next_decoded, next_obs, reduction='sum')
+    generation_loss = squaredErrorSum(decoded, obs) + squaredErrorSum(next_decoded, next_obs)
     loss_name = 'generation_loss'
     loss_manager.addToLosses(loss_name, weight, generation_loss)
     return weight * generation_loss
@@ -236,6 +281,21 @@ def perceptualSimilarityLoss(encoded_real, encoded_prediction, next_encoded_real
     return weight * pretrained_dae_encoding_loss
 
 
+@compileLoss
+def _klDivergence(mu, logvar):
+    # type: (Tensor, Tensor) -> Tensor
+    """
+    KL divergence between N(mu, exp(logvar)) and N(0, 1), summed over all elements
+    (the elementwise chain is fused in a single kernel).
+    The elementwise terms keep the input precision (e.g. bf16 under autocast),
+    the sum is done in at least fp32
+    :param mu: (th.Tensor)
+    :param logvar: (th.Tensor)
+    :return: (th.Tensor)
+    """
+    return -0.5 * (1 + logvar - mu * mu - logvar.exp()).sum(dtype=th.promote_types(mu.dtype, th.float32))
+
+
 def kullbackLeiblerLoss(mu, next_mu, logvar, next_logvar, loss_manager, beta=1):
     """
     KL divergence losses summed over all elements and batch
@@ -250,43 +310,150 @@ def kullbackLeiblerLoss(mu, next_mu, logvar, next_logvar, loss_manager, beta=1):
     # see Appendix B from VAE paper:
     # Kingma and Welling. Auto-Encoding Variational Bayes. ICLR, 2014
     # https://arxiv.org/abs/1312.6114
-    kl_divergence = -0.5 * th.sum(1 + logvar - mu.pow(2) - logvar.exp())
-    kl_divergence += -0.5 * th.sum(1 + next_logvar - next_mu.pow(2) - next_logvar.exp())
+    kl_divergence = _klDivergence(mu, logvar) + _klDivergence(next_mu, next_logvar)
     loss_manager.addToLosses('kl_loss', beta, kl_divergence)
     return beta * kl_divergence
 
 
-def mutualInformationLoss(states, rewards_st, weight, loss_manager):
+if NUMBA_AVAILABLE:
+    @njit(parallel=True, fastmath=True)
+    def _mutualInformationNumba(X, Y, mu_xy, sigma_xy, p_x, p_y, eps):
+        """
+        Accumulate the mutual information over all (x, y) pairs
+        without allocating the N x M x (dx + dy) joint grid
+        :param X: (np.ndarray)
+        :param Y: (np.ndarray)
+        :param mu_xy: (np.ndarray) mean of the joint samples
+        :param sigma_xy: (np.ndarray) std of the joint samples (eps included)
+        :param p_x: (np.ndarray)
+        :param p_y: (np.ndarray)
+        :param eps: (float)
+        :return: (float)
+        """
+        dim_x = X.shape[1]
+        I = 0.
+        for i in prange(X.shape[0]):
+            for j in range(Y.shape[0]):
+                sq_norm = 0.
+                for k in range(dim_x):
+                    z = (X[i, k] - mu_xy[k]) / sigma_xy[k]
+                    sq_norm += z * z
+                for k in range(Y.shape[1]):
+                    z = (Y[j, k] - mu_xy[dim_x + k]) / sigma_xy[dim_x + k]
+                    sq_norm += z * z
+                p_xy = np.exp(-sq_norm / 2) / np.sqrt(2 * np.pi) + eps
+                I += p_xy * np.log(p_xy / (p_x[i] * p_y[j]))
+        return I
+
+
+@compileLoss
+def _mutualInformation(X, Y):
+    # type: (Tensor, Tensor) -> Tensor
+    """
+    Mutual information between X and Y, assuming gaussian distributions
+    :param X: (th.Tensor)
+    :param Y: (th.Tensor)
+    :return: (th.Tensor)
+    """
+    eps = 1e-10
+    inv_sqrt_2pi = 0.3989422804014327  # 1 / sqrt(2 * pi)
+    p_x = inv_sqrt_2pi * th.exp(-th.sum(((X - th.mean(X, dim=0)) / (th.std(X, dim=0) + eps)) ** 2, dim=1) / 2) + eps
+    p_y = inv_sqrt_2pi * th.exp(-th.sum(((Y - th.mean(Y, dim=0)) / (th.std(Y, dim=0) + eps)) ** 2, dim=1) / 2) + eps
+
+    # Statistics of the joint distribution do not depend on the (x, y) pair
+    XY = th.cat([X, Y], dim=1)
+    mu_xy = th.mean(XY, dim=0)
+    sigma_xy = th.std(XY, dim=0) + eps
+    # Joint density over the N x M grid of all (x, y) pairs, computed in one pass
+    n_x, n_y = X.shape[0], Y.shape[0]
+    XY_grid = th.cat([X.unsqueeze(1).expand(n_x, n_y, X.shape[1]),
+                      Y.unsqueeze(0).expand(n_x, n_y, Y.shape[1])], dim=2)
+    z = (XY_grid - mu_xy) / sigma_xy
+    p_xy = inv_sqrt_2pi * th.exp(-th.sum(z ** 2, dim=2) / 2) + eps
+    return th.sum(p_xy * th.log(p_xy / (p_x.unsqueeze(1) * p_y.unsqueeze(0))))
+
+
+def mutualInformationLoss(states, rewards_st, weight, loss_manager, no_grad=False):
     """
-    TODO: Equation needs to be fixed for faster computation
     Loss criterion to assess mutual information between predicted states and rewards
     see: https://en.wikipedia.org/wiki/Mutual_information
     :param states: (th.Tensor)
     :param rewards_st:(th.Tensor)
     :param weight: coefficient to weight the loss (float)
     :param loss_manager: loss criterion needed to log the loss value
+    :param no_grad: (bool) only compute the value (no gradient), using a multithreaded CPU kernel
+        when numba is installed. It avoids the memory cost of the joint grid, use it for monitoring only
     :return:
     """
-    X = states
-    Y = rewards_st
-    I = 0
-    eps = 1e-10
-    p_x = float(1 / np.sqrt(2 * np.pi)) * \
-          th.exp(-th.pow(th.norm((X - th.mean(X, dim=0)) / (th.std(X, dim=0) + eps), 2, dim=1), 2) / 2) + eps
-    p_y = float(1 / np.sqrt(2 * np.pi)) * \
-          th.exp(-th.pow(th.norm((Y - th.mean(Y, dim=0)) / (th.std(Y, dim=0) + eps), 2, dim=1), 2) / 2) + eps
-    for x in range(X.shape[0]):
-        for y in range(Y.shape[0]):
-            p_xy = float(1 / np.sqrt(2 * np.pi)) * \
-                   th.exp(-th.pow(th.norm((th.cat([X[x], Y[y]]) - th.mean(th.cat([X, Y], dim=1), dim=0)) /
-                                          (th.std(th.cat([X, Y], dim=1), dim=0) + eps), 2), 2) / 2) + eps
-            I += p_xy * th.log(p_xy / (p_x[x] * p_y[y]))
+    if no_grad and NUMBA_AVAILABLE:
+        return _mutualInformationDiagnostic(states, rewards_st, weight, loss_manager)
 
+    I = _mutualInformation(states, rewards_st)
     mutual_info_loss = th.exp(-I)
     loss_manager.addToLosses('mutual_info', weight, mutual_info_loss)
     return weight * mutual_info_loss
 
 
+def _mutualInformationCPU(X, Y):
+    """
+    Same as _mutualInformation, using the numba kernel
+    :param X: (np.ndarray)
+    :param Y: (np.ndarray)
+    :return: (float)
+    """
+    eps = 1e-10
+    p_x = np.exp(-np.sum(((X - X.mean(0)) / (X.std(0, ddof=1) + eps)) ** 2, axis=1) / 2) / np.sqrt(2 * np.pi) + eps
+    p_y = np.exp(-np.sum(((Y - Y.mean(0)) / (Y.std(0, ddof=1) + eps)) ** 2, axis=1) / 2) / np.sqrt(2 * np.pi) + eps
+    XY = np.concatenate([X, Y], axis=1)
+    return _mutualInformationNumba(X, Y, XY.mean(0), XY.std(0, ddof=1) + eps, p_x, p_y, eps)
+
+
+def _mutualInformationDiagnostic(states, rewards_st, weight, loss_manager):
+    """
+    Mutual information loss computed by the numba kernel (the result is detached from the graph)
+    :param states: (th.Tensor)
+    :param rewards_st:(th.Tensor)
+    :param weight: coefficient to weight the loss (float)
+    :param loss_manager: loss criterion needed to log the loss value
+    :return: (th.Tensor)
+    """
+    I = _mutualInformationCPU(states.detach().cpu().double().numpy(),
+                              rewards_st.detach().cpu().double().numpy())
+
+    mutual_info_loss = th.tensor(np.exp(-I), dtype=states.dtype, device=states.device)
+    loss_manager.addToLosses('mutual_info', weight, mutual_info_loss)
+    return weight * mutual_info_loss
+
+
+@compileLoss
+def _rewardCorrelation(states, rewards_st):
+    # type: (Tensor, Tensor) -> Tensor
+    """
+    Mean absolute correlation between the rewards and [states, rewards],
+    i.e. the last rows of correlationMatrix(th.cat([states, rewards_st], dim=1).t()),
+    without computing the correlation between the states themselves
+    :param states: (th.Tensor) Shape: (B, D)
+    :param rewards_st: (th.Tensor) Shape: (B, R)
+    :return: (th.Tensor)
+    """
+    eps = 1e-8
+    n_samples = states.shape[0]
+    # Center first: computing the variance as E[x^2] - E[x]^2 cancels badly in fp32 (and can become negative)
+    states_bar = states - states.mean(0, keepdim=True)
+    rewards_bar = rewards_st - rewards_st.mean(0, keepdim=True)
+    cov_states_rewards = th.mm(states_bar.t(), rewards_bar) / (n_samples - 1)
+    cov_rewards = th.mm(rewards_bar.t(), rewards_bar) / (n_samples - 1)
+    var_states = (states_bar * states_bar).sum(0) / (n_samples - 1)
+
+    inv_std_states = th.rsqrt(var_states + eps)
+    inv_std_rewards = th.rsqrt(th.diag(cov_rewards) + eps)
+    corr_states_rewards = cov_states_rewards * inv_std_states.unsqueeze(1) * inv_std_rewards.unsqueeze(0)
+    corr_rewards = cov_rewards * inv_std_rewards.unsqueeze(1) * inv_std_rewards.unsqueeze(0)
+    n_elements = rewards_st.shape[1] * (states.shape[1] + rewards_st.shape[1])
+    return (th.abs(corr_states_rewards.clamp(-1.0, 1.0)).sum() +
+            th.abs(corr_rewards.clamp(-1.0, 1.0)).sum()) / n_elements
+
+
 def rewardPriorLoss(states, rewards_st, weight, loss_manager):
     """
     Loss expressing correlation between predicted states and reward
@@ -296,23 +463,25 @@ def rewardPriorLoss(states, rewards_st, weight, loss_manager):
     :param loss_manager: loss criterion needed to log the loss value
     :return:
     """
-    corr_matrix = correlationMatrix(th.cat([states, rewards_st], dim=1).t())
-    # Maximise correlation between states and rewards (last rows)
-    reward_prior_loss = 1 - th.mean(th.abs(corr_matrix[-rewards_st.shape[1]:, :]))
+    # Maximise correlation between states and rewards
+    reward_prior_loss = 1 - _rewardCorrelation(states, rewards_st)
 
     loss_manager.addToLosses('reward_prior', weight, reward_prior_loss)
     return weight * reward_prior_loss
 
 
-def episodePriorLoss(minibatch_idx, minibatch_episodes, states, discriminator, balanced_sampling, weight, loss_manager):
+def episodePriorLoss(minibatch_idx, minibatch_episodes, states, discriminator, balanced_sampling, weight, loss_manager,
+                     minibatch_episodes_tensors=None):
     """
     :param minibatch_idx:
-    :param minibatch_episodes:
+    :param minibatch_episodes: ([np.ndarray]) episode index of each observation, for every minibatch
     :param states: (th.Tensor)
     :param discriminator: (model)
     :param balanced_sampling: (boool)
     :param weight: coefficient to weight the loss (float)
     :param loss_manager: loss criterion needed to log the loss value (LossManager)
+    :param minibatch_episodes_tensors: ([th.Tensor]) minibatch_episodes already on the device
+        (see LossManager.pairsToDevice), if None they are uploaded at each call
     :return:
     """
     # The "episode prior" idea is really close
@@ -328,37 +497,53 @@ def episodePriorLoss(minibatch_idx, minibatch_episodes, states, discriminator, b
     # Reverse gradient
     reverse_states = ReverseLayerF.apply(states, lambda_)
 
-    criterion_episode = nn.BCELoss(reduction='sum')
     # Get episodes indices for current minibatch
-    episodes = np.array(minibatch_episodes[minibatch_idx])
+    episodes = np.asarray(minibatch_episodes[minibatch_idx])
+    if minibatch_episodes_tensors is not None:
+        episodes_tensor = minibatch_episodes_tensors[minibatch_idx]
+    else:
+        episodes_tensor = th.from_numpy(episodes).to(states.device)
 
     # Sample other states
     if balanced_sampling:
         # Balanced sampling
-        others_idx = np.arange(len(episodes))
-        for i in range(len(episodes)):
-            if np.random.rand() > 0.5:
-                others_idx[i] = np.random.choice(np.where(episodes != episodes[i])[0])
-            else:
-                others_idx[i] = np.random.choice(np.where(episodes == episodes[i])[0])
+        others_idx = th.from_numpy(balancedSampling(episodes)).to(states.device)
     else:
-        # Uniform (unbalanced) sampling
-        others_idx = np.random.permutation(len(states))
+        # Uniform (unbalanced) sampling, directly on the device
+        others_idx = th.randperm(len(states), device=states.device)
 
-    # Create input for episode discriminator
-    episode_input = th.cat((reverse_states, reverse_states[others_idx, :]), dim=1)
-    episode_output = discriminator(episode_input)
+    # The discriminator takes the two states separately (no concatenated input)
+    episode_output = discriminator(reverse_states, th.index_select(reverse_states, 0, others_idx))
 
-    others_episodes = episodes[others_idx]
-    same_episodes = th.from_numpy((episodes == others_episodes).astype(np.float32))
-    same_episodes = same_episodes.to(states.device)
+    # Targets are computed on the device, no host to device copy
+    same_episodes = (episodes_tensor == th.index_select(episodes_tensor, 0, others_idx)).to(episode_output.dtype)
 
     # TODO: classification accuracy/loss
-    episode_loss = criterion_episode(episode_output.squeeze(1), same_episodes)
+    # Sigmoid and binary cross-entropy are fused for numerical stability
+    episode_loss = F.binary_cross_entropy_with_logits(episode_output.squeeze(1), same_episodes, reduction='sum')
     loss_manager.addToLosses('episode_prior', weight, episode_loss)
     return weight * episode_loss
 
 
+@compileLoss
+def _tripletLoss(states, p_states, n_states, alpha):
+    # type: (Tensor, Tensor, Tensor, float) -> Tensor
+    """
+    Time-Contrastive Triplet Loss (see tripletLoss)
+    NOTE: it uses squared euclidean distances, so it is not equivalent to F.triplet_margin_loss
+    :param states: (th.Tensor)
+    :param p_states: (th.Tensor)
+    :param n_states: (th.Tensor)
+    :param alpha: (float)
+    :return: (th.Tensor)
+    """
+    diff_positive = states - p_states
+    diff_negative = states - n_states
+    distance_positive = (diff_positive * diff_positive).sum(1)
+    distance_negative = (diff_negative * diff_negative).sum(1)
+    return F.relu(distance_positive - distance_negative + alpha).mean()
+
+
 def tripletLoss(states, p_states, n_states, weight, loss_manager, alpha=0.2):
     """
     :param alpha: (float) margin that is enforced between positive & neg observation (TCN Triplet Loss)
@@ -367,10 +552,6 @@ def tripletLoss(states, p_states, n_states, weight, loss_manager, alpha=0.2):
     :param n_states: (th.Tensor) states for the negative obs
     :return: (th.Tensor)
     """
-    # Time-Contrastive Triplet Loss
-    distance_positive = (states - p_states).pow(2).sum(1)
-    distance_negative = (states - n_states).pow(2).sum(1)
-    tcn_triplet_loss = F.relu(distance_positive - distance_negative + alpha)
-    tcn_triplet_loss = tcn_triplet_loss.mean()
+    tcn_triplet_loss = _tripletLoss(states, p_states, n_states, alpha)
     loss_manager.addToLosses('triplet_loss', weight, tcn_triplet_loss)
     return weight * tcn_triplet_loss
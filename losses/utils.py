@@ -1,8 +1,52 @@
 from pipeline import NO_PAIRS_ERROR
-from utils import printRed
+from utils import printRed, printYellow
+
+import functools
 
 import torch as th
 import numpy as np
+from torch.autograd import Function
+
+# Whether to compile the tensor part of the losses (can be disabled with --no-compile-losses in train.py)
+COMPILE_LOSSES = True
+
+
+def compileLoss(loss_fn):
+    """
+    Compile a function that only operates on tensors, so its elementwise operations are fused
+    (torch.compile when available, TorchScript otherwise).
+    Compilation happens at the first call (if COMPILE_LOSSES is True)
+    and the function falls back to eager execution if it cannot be compiled.
+    Functions that log values (LossManager) must stay outside the compiled part
+    :param loss_fn: (function)
+    :return: (function)
+    """
+    # None: not compiled yet, loss_fn: eager execution
+    compiled_fn = [None]
+
+    def fallback(error):
+        printYellow("Could not compile {}, using eager mode: {}".format(loss_fn.__name__, error))
+        compiled_fn[0] = loss_fn
+
+    @functools.wraps(loss_fn)
+    def wrapper(*args):
+        if not COMPILE_LOSSES or compiled_fn[0] is loss_fn:
+            return loss_fn(*args)
+        if compiled_fn[0] is None:
+            try:
+                compiled_fn[0] = th.compile(loss_fn) if hasattr(th, 'compile') else th.jit.script(loss_fn)
+            except Exception as e:
+                fallback(e)
+                return loss_fn(*args)
+        try:
+            # torch.compile is lazy: compilation errors are only raised at the first call
+            return compiled_fn[0](*args)
+        except Exception as e:
+            fallback(e)
+            return loss_fn(*args)
+
+    return wrapper
+
 
 def overSampling(batch_size, m_list, pairs, function_on_pairs, actions, rewards):
     """
@@ -83,6 +127,8 @@ def findPriorsPairs(batch_size, minibatchlist, actions, rewards, n_actions, n_pa
     :param n_pairs_per_action: ([int])
     :return: ([np.ndarray], [np.ndarray])
     """
+    # NOTE: pairs are generated in increasing order of their first index (then of the second one),
+    # so the gathers in roboticPriorsLoss read the states almost sequentially. No need to sort them afterward.
     dissimilar_pairs = [
         np.array(
             [[i, j] for i in range(batch_size) for j in findDissimilar(i, minibatch, minibatch, actions, rewards) if
@@ -116,6 +162,84 @@ def findPriorsPairs(batch_size, minibatchlist, actions, rewards, n_actions, n_pa
     return dissimilar_pairs, same_actions_pairs
 
 
+def balancedSampling(episodes):
+    """
+    For each observation, sample another observation of the minibatch
+    that comes from the same episode or from a different one with equal probability
+    :param episodes: (np.ndarray) episode index of each observation of the minibatch
+    :return: (np.ndarray) indices of the sampled observations
+    """
+    n_samples = len(episodes)
+    pick_different = np.random.rand(n_samples) > 0.5
+    # Group the observations by episode once: group k is order[starts[k]:starts[k] + counts[k]]
+    _, group, counts = np.unique(episodes, return_inverse=True, return_counts=True)
+    order = np.argsort(group, kind='stable')
+    starts = np.cumsum(counts) - counts
+    group_start, group_count = starts[group], counts[group]
+    n_others = n_samples - group_count
+    if np.any(pick_different & (n_others == 0)):
+        raise ValueError("Balanced sampling requires at least two episodes per minibatch")
+
+    # Same episode: random offset inside the group
+    same_pos = group_start + (np.random.rand(n_samples) * group_count).astype(np.int64)
+    # Different episode: random offset in the complement of the group (skipping over it)
+    offset = (np.random.rand(n_samples) * n_others).astype(np.int64)
+    different_pos = np.where(offset < group_start, offset, offset + group_count)
+    # Positions are only valid where the choice is possible
+    different_pos = np.minimum(different_pos, n_samples - 1)
+    return order[np.where(pick_different, different_pos, same_pos)]
+
+
+class SquaredErrorSum(Function):
+    """
+    Sum of squared errors, equivalent to F.mse_loss(input, target, reduction='sum').
+    The forward pass is computed chunk by chunk so the squared difference
+    of the whole batch is never materialized
+    """
+
+    @staticmethod
+    def forward(ctx, input_tensor, target, n_chunks):
+        """
+        :param input_tensor: (th.Tensor)
+        :param target: (th.Tensor)
+        :param n_chunks: (int) number of chunks along the batch dimension
+        :return: (th.Tensor)
+        """
+        if input_tensor.shape != target.shape:
+            raise ValueError("Input and target must have the same shape, got {} and {}".format(
+                tuple(input_tensor.shape), tuple(target.shape)))
+        ctx.save_for_backward(input_tensor, target)
+        # Accumulate in at least fp32, even when the inputs are in half precision (mixed precision training)
+        accumulate_dtype = th.promote_types(input_tensor.dtype, th.float32)
+        total = input_tensor.new_zeros((), dtype=accumulate_dtype)
+        for input_chunk, target_chunk in zip(input_tensor.chunk(n_chunks), target.chunk(n_chunks)):
+            diff = input_chunk - target_chunk
+            total += (diff * diff).sum(dtype=accumulate_dtype)
+        return total
+
+    @staticmethod
+    def backward(ctx, grad_output):
+        """
+        :param grad_output: (th.Tensor)
+        :return: (th.Tensor, th.Tensor, None)
+        """
+        input_tensor, target = ctx.saved_tensors
+        grad_input = (input_tensor - target).mul_(2 * grad_output.to(input_tensor.dtype))
+        grad_target = grad_input.neg() if ctx.needs_input_grad[1] else None
+        return grad_input, grad_target, None
+
+
+def squaredErrorSum(input_tensor, target, n_chunks=4):
+    """
+    Memory efficient version of F.mse_loss(input_tensor, target, reduction='sum')
+    :param input_tensor: (th.Tensor)
+    :param target: (th.Tensor)
+    :param n_chunks: (int)
+    :return: (th.Tensor)
+    """
+    return SquaredErrorSum.apply(input_tensor, target, n_chunks)
+
+
 # From https://github.com/pytorch/pytorch/pull/4411
 def correlationMatrix(mat, eps=1e-8):
     """
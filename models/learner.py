@@ -187,7 +187,7 @@ class SRL4robotics(BaseLearner):
         self.device = th.device("cuda" if th.cuda.is_available() and cuda else "cpu")
 
         if self.episode_prior:
-            self.discriminator = Discriminator(2 * self.state_dim).to(self.device)
+            self.discriminator = Discriminator(self.state_dim).to(self.device)
 
         self.model = self.model.to(self.device)
 
@@ -327,7 +327,8 @@ class SRL4robotics(BaseLearner):
 
         if self.episode_prior:
             idx_to_episode = {idx: episode_idx for idx, episode_idx in enumerate(np.cumsum(episode_starts))}
-            minibatch_episodes = [[idx_to_episode[i] for i in minibatch] for minibatch in minibatchlist]
+            minibatch_episodes = [np.array([idx_to_episode[i] for i in minibatch], dtype=np.int64)
+                                  for minibatch in minibatchlist]
 
         data_loader = DataLoader(minibatchlist, images_path, n_workers=N_WORKERS, multi_view=self.multi_view,
                                  use_triplets=self.use_triplets, is_training=True, apply_occlusion=self.use_dae,
@@ -340,6 +341,13 @@ class SRL4robotics(BaseLearner):
 
         loss_manager = LossManager(self.model, loss_history)
 
+        if not self.no_priors:
+            dissimilar_pairs = LossManager.pairsToDevice(dissimilar_pairs, self.device)
+            same_actions_pairs = LossManager.pairsToDevice(same_actions_pairs, self.device)
+
+        if self.episode_prior:
+            minibatch_episodes_tensors = LossManager.pairsToDevice(minibatch_episodes, self.device)
+
         best_error = np.inf
         best_model_path = "{}/srl_model.pth".format(self.log_folder)
         start_time = time.time()
@@ -476,7 +484,7 @@ class SRL4robotics(BaseLearner):
                 if self.episode_prior:
                     episodePriorLoss(minibatch_idx, minibatch_episodes, states, self.discriminator,
                                      BALANCED_SAMPLING, weight=self.losses_weights_dict['episode-prior'],
-                                     loss_manager=loss_manager)
+                                     loss_manager=loss_manager, minibatch_episodes_tensors=minibatch_episodes_tensors)
                 if self.use_triplets:
                     tripletLoss(states, positive_states, negative_states, weight=self.losses_weights_dict['triplet'],
                                 loss_manager=loss_manager, alpha=0.2)
@@ -157,19 +157,27 @@ class ReverseLayerF(Function):
 class Discriminator(nn.Module):
     """
     Discriminator network to distinguish states from two different episodes
-    :input_dim: (int) input_dim = 2 * state_dim
+    It outputs logits (no sigmoid), to be used with F.binary_cross_entropy_with_logits
+    :param state_dim: (int)
     """
 
-    def __init__(self, input_dim):
+    def __init__(self, state_dim):
         super(Discriminator, self).__init__()
+        # Equivalent to nn.Linear(2 * state_dim, 64) applied to the concatenation of the two states,
+        # without allocating the concatenated input
+        self.fc_states = nn.Linear(state_dim, 64)
+        self.fc_other_states = nn.Linear(state_dim, 64, bias=False)
         self.net = nn.Sequential(
-            nn.Linear(input_dim, 64),
             nn.ReLU(inplace=True),
             nn.Linear(64, 64),
             nn.ReLU(inplace=True),
-            nn.Linear(64, 1),
-            nn.Sigmoid()
+            nn.Linear(64, 1)
         )
 
-    def forward(self, x):
-        return self.net(x)
+    def forward(self, states, other_states):
+        """
+        :param states: (th.Tensor)
+        :param other_states: (th.Tensor)
+        :return: (th.Tensor)
+        """
+        return self.net(self.fc_states(states) + self.fc_other_states(other_states))
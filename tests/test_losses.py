@@ -0,0 +1,159 @@
+from __future__ import print_function, division, absolute_import
+
+import numpy as np
+import pytest
+import torch as th
+import torch.nn.functional as F
+
+from losses.losses import LossManager, mutualInformationLoss, _mutualInformation, _mutualInformationCPU, \
+    _rewardCorrelation, _roboticPriors, _klDivergence
+from losses.utils import correlationMatrix, balancedSampling, squaredErrorSum, compileLoss
+from .common import SEED, assertEq
+
+
+def referenceRewardCorrelation(states, rewards_st):
+    """
+    Reward prior as computed from the full correlation matrix
+    :param states: (th.Tensor)
+    :param rewards_st: (th.Tensor)
+    :return: (float)
+    """
+    corr_matrix = correlationMatrix(th.cat([states, rewards_st], dim=1).t())
+    return th.mean(th.abs(corr_matrix[-rewards_st.shape[1]:, :])).item()
+
+
+def assertRewardCorrelation(states, rewards_st):
+    expected = referenceRewardCorrelation(states, rewards_st)
+    value = _rewardCorrelation(states, rewards_st).item()
+    assert np.isfinite(value), "Reward correlation is not finite"
+    assert abs(value - expected) < 1e-5, '{} != {}'.format(value, expected)
+
+
+def testRewardCorrelation():
+    th.manual_seed(SEED)
+    states = th.randn(256, 10)
+    rewards_st = (th.rand(256, 1) > 0.5).float()
+    assertRewardCorrelation(states, rewards_st)
+
+
+def testRewardCorrelationConstantState():
+    th.manual_seed(SEED)
+    states = th.randn(256, 10)
+    states[:, 2] = 0.37
+    rewards_st = (th.rand(256, 1) > 0.5).float()
+    assertRewardCorrelation(states, rewards_st)
+
+
+def testRewardCorrelationLargeOffset():
+    th.manual_seed(SEED)
+    rewards_st = (th.rand(256, 1) > 0.5).float()
+    for offset in [100, 1000]:
+        states = th.randn(256, 10) * 0.1 + offset
+        assertRewardCorrelation(states, rewards_st)
+
+
+def testRoboticPriorsZeroStateDiff():
+    th.manual_seed(SEED)
+    states = th.randn(16, 4, requires_grad=True)
+    next_states = th.randn(16, 4)
+    # Identical consecutive frames
+    next_states[2] = states[2].detach()
+    pairs = th.from_numpy(np.array([[0, 2], [2, 5], [3, 7]], dtype=np.int64))
+    total_loss = sum(_roboticPriors(states, next_states, pairs, pairs))
+    total_loss.backward()
+    assert th.isfinite(states.grad).all(), "NaN gradient when a state equals the next state"
+
+
+def testBalancedSampling():
+    np.random.seed(SEED)
+    episodes = np.array([0, 0, 1, 1, 1, 2, 5, 5, 5, 5])
+    n_draws = 4000
+    others_idx = np.array([balancedSampling(episodes) for _ in range(n_draws)])
+    same_episode = episodes[others_idx] == episodes
+    # Same or different episode with equal probability
+    assert abs(same_episode.mean() - 0.5) < 0.02, same_episode.mean()
+
+    # Uniform sampling inside the same episode / among the other episodes, for every observation
+    for i, episode in enumerate(episodes):
+        for candidates, mask in [(np.where(episodes == episode)[0], same_episode[:, i]),
+                                 (np.where(episodes != episode)[0], ~same_episode[:, i])]:
+            picks = others_idx[mask, i]
+            assert np.all(np.isin(picks, candidates))
+            frequencies = np.bincount(picks, minlength=len(episodes))[candidates] / len(picks)
+            assert np.all(np.abs(frequencies - 1. / len(candidates)) < 0.1), frequencies
+
+
+def testBalancedSamplingSingleEpisode():
+    np.random.seed(SEED)
+    with pytest.raises(ValueError):
+        # Enough samples for at least one "different episode" pick
+        balancedSampling(np.zeros(64, dtype=np.int64))
+
+
+def testMutualInformationNumba():
+    pytest.importorskip('numba')
+    th.manual_seed(SEED)
+    states = th.randn(64, 3, dtype=th.float64)
+    rewards_st = (th.rand(64, 1) > 0.5).double()
+    expected = _mutualInformation(states, rewards_st).item()
+    value = _mutualInformationCPU(states.numpy(), rewards_st.numpy())
+    assert abs(value - expected) < 1e-6 * abs(expected), '{} != {}'.format(value, expected)
+
+    # Wrapper: detached value logged by the loss manager
+    loss_manager = LossManager(th.nn.Linear(1, 1))
+    loss = mutualInformationLoss(states.requires_grad_(), rewards_st, 1.0, loss_manager, no_grad=True)
+    assert not loss.requires_grad
+    assert loss_manager.names == ['mutual_info']
+
+
+def testSquaredErrorSum():
+    th.manual_seed(SEED)
+    # 10 is not a multiple of n_chunks
+    for batch_size, n_chunks in [(8, 4), (10, 4), (3, 4)]:
+        input_tensor = th.randn(batch_size, 3, 5, 5, requires_grad=True)
+        target = th.randn(batch_size, 3, 5, 5, requires_grad=True)
+
+        loss = squaredErrorSum(input_tensor, target, n_chunks)
+        loss.backward()
+        grads = input_tensor.grad.clone(), target.grad.clone()
+        input_tensor.grad, target.grad = None, None
+
+        expected_loss = F.mse_loss(input_tensor, target, reduction='sum')
+        expected_loss.backward()
+        assert abs(loss.item() - expected_loss.item()) < 1e-4 * expected_loss.item()
+        assert th.allclose(grads[0], input_tensor.grad)
+        assert th.allclose(grads[1], target.grad)
+
+    with pytest.raises(ValueError):
+        squaredErrorSum(th.randn(10, 3), th.randn(7, 3))
+
+
+def testCompileLossFallback(monkeypatch):
+    def failingCompile(loss_fn):
+        def compiled_fn(*args):
+            raise RuntimeError("No compiler available")
+        return compiled_fn
+
+    monkeypatch.setattr(th, 'compile', failingCompile, raising=False)
+    states = th.randn(8, 2)
+    expected = (states * 2).sum()
+    assertEq(compileLoss(lambda x: (x * 2).sum())(states).item(), expected.item())
+
+
+def testLossesPrecision():
+    th.manual_seed(SEED)
+    # float64 inputs must not be downcast
+    input_tensor = th.randn(10, 3, 4, 4, dtype=th.float64, requires_grad=True)
+    target = th.randn(10, 3, 4, 4, dtype=th.float64, requires_grad=True)
+    loss = squaredErrorSum(input_tensor, target, 4)
+    assertEq(loss.dtype, th.float64)
+    assert abs(loss.item() - F.mse_loss(input_tensor, target, reduction='sum').item()) < 1e-10
+    assert th.autograd.gradcheck(lambda x, y: squaredErrorSum(x, y, 4), (input_tensor, target))
+
+    mu, logvar = th.randn(8, 5, dtype=th.float64), th.randn(8, 5, dtype=th.float64)
+    kl_divergence = _klDivergence(mu, logvar)
+    assertEq(kl_divergence.dtype, th.float64)
+
+    # Half precision inputs are accumulated in fp32
+    assertEq(squaredErrorSum(input_tensor.detach().bfloat16(), target.detach().bfloat16()).dtype, th.float32)
+    assertEq(_klDivergence(mu.bfloat16(), logvar.bfloat16()).dtype, th.float32)
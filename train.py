@@ -12,6 +12,7 @@ import numpy as np
 import torch as th
 
 import preprocessing
+import losses.utils as losses_utils
 import models.learner as learner
 import plotting.representation_plot as plot_script
 from models.learner import SRL4robotics
@@ -52,6 +53,8 @@ if __name__ == '__main__':
                         help='Enable use of multiple camera')
     parser.add_argument('--balanced-sampling', action='store_true', default=False,
                         help='Force balanced sampling for episode independent prior instead of uniform')
+    parser.add_argument('--no-compile-losses', action='store_true', default=False,
+                        help='Disable the compilation (kernel fusion) of the losses')
     parser.add_argument('--losses', nargs='+', default=["inverse"], **parseLossArguments(
         choices=["forward", "inverse", "reward", "priors", "episode-prior", "reward-prior", "triplet",
                  "autoencoder", "vae", "perceptual", "dae", "random"],
@@ -74,6 +77,7 @@ if __name__ == '__main__':
     learner.BATCH_SIZE = args.batch_size
     learner.VALIDATION_SIZE = args.val_size
     learner.BALANCED_SAMPLING = args.balanced_sampling
+    losses_utils.COMPILE_LOSSES = not args.no_compile_losses
     plot_script.INTERACTIVE_PLOT = learner.DISPLAY_PLOTS
 
     # Dealing with losses to use